@@ -1,12 +1,104 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import math
 import time
-from scipy.sparse import lil_matrix
-from scipy.sparse.linalg import spsolve
+import functools
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import spsolve, splu
 import scipy.sparse.csgraph
 from scipy.optimize import curve_fit
+from scipy.linalg import cholesky as dense_cholesky, solve_triangular
 from scipy.sparse import csr_matrix
+try:
+    from sksparse.cholmod import analyze as cholmod_analyze, cholesky as cholmod_cholesky, Factor
+except ImportError:
+    # scikit-sparse is optional, without it the Cholesky factor is computed densely
+    cholmod_analyze = None
+    cholmod_cholesky = None
+    Factor = None
+try:
+    import numba
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the SSOR sweep runs as plain Python
+    numba = None
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+@njit(cache=True)
+def ssor_sweep(indptr, indices, data, diag, b, x, omega, n):
+    """Perform one forward and one backward SOR sweep on a CSR matrix, updating x in place."""
+    # Forward sweep
+    for i in range(n):
+        sigma = 0.0
+        for k in range(indptr[i], indptr[i + 1]):
+            if indices[k] != i:
+                sigma += float(data[k]) * x[indices[k]]
+        x[i] = (1 - omega) * x[i] + omega * (b[i] - sigma) / diag[i]
+
+    # Backward sweep
+    for i in range(n - 1, -1, -1):
+        sigma = 0.0
+        for k in range(indptr[i], indptr[i + 1]):
+            if indices[k] != i:
+                sigma += float(data[k]) * x[indices[k]]
+        x[i] = (1 - omega) * x[i] + omega * (b[i] - sigma) / diag[i]
+
+    return x
+
+
+@njit(cache=True)
+def stencil_matvec_2d(X, Y, n):
+    """Apply the 5-point stencil of the system matrix to the grid values X, writing into Y."""
+    for i in range(n):
+        for j in range(n):
+            if i == 0 or i == n - 1 or j == 0 or j == n - 1:
+                # Boundary rows of A are rows of the identity
+                Y[i, j] = X[i, j]
+            else:
+                # Couplings to boundary nodes were eliminated from A, so skip them
+                value = 4.0 * X[i, j]
+                if i > 1:
+                    value -= X[i - 1, j]
+                if i < n - 2:
+                    value -= X[i + 1, j]
+                if j > 1:
+                    value -= X[i, j - 1]
+                if j < n - 2:
+                    value -= X[i, j + 1]
+                Y[i, j] = value
+    return Y
+
+
+@njit(cache=True)
+def stencil_matvec_3d(X, Y, n):
+    """Apply the 7-point stencil of the system matrix to the grid values X, writing into Y."""
+    for i in range(n):
+        for j in range(n):
+            for k in range(n):
+                if i == 0 or i == n - 1 or j == 0 or j == n - 1 or k == 0 or k == n - 1:
+                    # Boundary rows of A are rows of the identity
+                    Y[i, j, k] = X[i, j, k]
+                else:
+                    # Couplings to boundary nodes were eliminated from A, so skip them
+                    value = 6.0 * X[i, j, k]
+                    if i > 1:
+                        value -= X[i - 1, j, k]
+                    if i < n - 2:
+                        value -= X[i + 1, j, k]
+                    if j > 1:
+                        value -= X[i, j - 1, k]
+                    if j < n - 2:
+                        value -= X[i, j + 1, k]
+                    if k > 1:
+                        value -= X[i, j, k - 1]
+                    if k < n - 2:
+                        value -= X[i, j, k + 1]
+                    Y[i, j, k] = value
+    return Y
+
 
 class Problem():
     def __init__(self, n_elements, dimension):
@@ -14,178 +106,133 @@ class Problem():
         self.dimension = dimension
         self.matrix, self.rhs = self.build_matrix_and_rhs(n_elements, dimension)
         self.reordered_matrix = self.reorder()
-        #self.cholesky_factor, self.cholesky_time = self.cholesky(self.matrix)
-        #self.cholesky_factor_reorderd, self.cholesky_time_reordered = self.cholesky(self.reordered_matrix)
+        self.reordered_rhs = np.take(self.rhs, self.rcm_order)
+        self.inverse_order = np.argsort(self.rcm_order)
+        # Symbolic analyses and factor nonzero counts are computed on first use by
+        # factorize() and then reused
+        self.symbolic, self.symbolic_reordered = None, None
+        self.analyze_time, self.analyze_time_reordered = 0.0, 0.0
+        self.matrix_float, self.reordered_matrix_float = None, None
+        self.cholesky_nnz, self.cholesky_nnz_reordered = None, None
+        self.lu = None
 
     def build_matrix_and_rhs(self, n_elements, dimension):
         spacing = 1.0 / (n_elements + 1)
+        coords = np.arange(1, n_elements + 1) * spacing
         if dimension == 2:
             num_points = n_elements * n_elements
-            A = lil_matrix((num_points, num_points))
-            f_vector = np.zeros(num_points)
-            boundary_nodes = []
-
-            # Define the source function f(x, y)
-            def f(x, y):
-                return (x**2 + y**2) * math.sin(x * y)
-
-            for i in range(n_elements):
-                for j in range(n_elements):
-                    p = i * n_elements + j
-                    x = (i + 1) * spacing
-                    y = (j + 1) * spacing
-
-                    # Check if the point is on the boundary
-                    if i == 0 or i == n_elements - 1 or j == 0 or j == n_elements - 1:
-                        # Boundary condition: u = u_0
-                        u_0 = math.sin(x * y)
-                        A[p, p] = 1
-                        f_vector[p] = u_0
-                        boundary_nodes.append(p)
-                    else:
-                        # Interior points
-                        A[p, p] = 4
-                        neighbors = self.get_neighbors_2d(p, n_elements)
-                        for neighbor_p in neighbors:
-                            A[p, neighbor_p] = -1
-                        f_vector[p] = f(x, y) * spacing**2
-
-            # Adjust RHS for interior nodes to account for boundary conditions
-            for p in boundary_nodes:
-                u_0 = f_vector[p]  # Boundary value
-                neighbors = self.get_neighbors_2d(p, n_elements)
-                for q in neighbors:
-                    # Only adjust if q is an interior node
-                    if A[q, p] != 0:
-                        f_vector[q] -= A[q, p] * u_0
-
-            # Zero out columns and rows for boundary nodes to maintain symmetry
-            for p in boundary_nodes:
-                A[p, :] = 0
-                A[:, p] = 0
-                A[p, p] = 1
-
-            return A.tocsr(), f_vector
+            ii, jj = np.meshgrid(np.arange(n_elements), np.arange(n_elements), indexing='ij')
+            nodes = (ii * n_elements + jj).ravel()
+            interior = ((ii > 0) & (ii < n_elements - 1) &
+                        (jj > 0) & (jj < n_elements - 1)).ravel()
+            diagonal_value = 4
+            offsets = (-1, 1, -n_elements, n_elements)
+
+            # Source function f(x, y) and boundary values u_0 on the whole grid
+            X, Y = np.meshgrid(coords, coords, indexing='ij')
+            u_0 = np.sin(X * Y).ravel()
+            source = (X**2 + Y**2).ravel() * u_0
 
         elif dimension == 3:
             num_points = n_elements * n_elements * n_elements
-            A = lil_matrix((num_points, num_points))
-            f_vector = np.zeros(num_points)
-            boundary_nodes = []
-
-            # Define the source function f(x, y, z)
-            def f(x, y, z):
-                return (x**2 * y**2 + z**2 * y**2 + x**2 * z**2) * math.sin(x * y * z)
-
-            for i in range(n_elements):
-                for j in range(n_elements):
-                    for k in range(n_elements):
-                        p = i * n_elements * n_elements + j * n_elements + k
-                        x = (i + 1) * spacing
-                        y = (j + 1) * spacing
-                        z = (k + 1) * spacing
-
-                        # Check if the point is on the boundary
-                        if (i == 0 or i == n_elements - 1 or
-                            j == 0 or j == n_elements - 1 or
-                            k == 0 or k == n_elements - 1):
-                            # Boundary condition: u = u_0
-                            u_0 = math.sin(x * y * z)
-                            A[p, p] = 1
-                            f_vector[p] = u_0
-                            boundary_nodes.append(p)
-                        else:
-                            # Interior points
-                            A[p, p] = 6
-                            neighbors = self.get_neighbors_3d(p, n_elements)
-                            for neighbor_p in neighbors:
-                                A[p, neighbor_p] = -1
-                            f_vector[p] = f(x, y, z) * spacing**2
-
-            # Adjust RHS for interior nodes to account for boundary conditions
-            for p in boundary_nodes:
-                u_0 = f_vector[p]  # Boundary value
-                neighbors = self.get_neighbors_3d(p, n_elements)
-                for q in neighbors:
-                    # Only adjust if q is an interior node
-                    if A[q, p] != 0:
-                        f_vector[q] -= A[q, p] * u_0
-
-            # Zero out columns and rows for boundary nodes to maintain symmetry
-            for p in boundary_nodes:
-                A[p, :] = 0
-                A[:, p] = 0
-                A[p, p] = 1
-
-            return A.tocsr(), f_vector
+            ii, jj, kk = np.meshgrid(np.arange(n_elements), np.arange(n_elements),
+                                     np.arange(n_elements), indexing='ij')
+            nodes = (ii * n_elements * n_elements + jj * n_elements + kk).ravel()
+            interior = ((ii > 0) & (ii < n_elements - 1) &
+                        (jj > 0) & (jj < n_elements - 1) &
+                        (kk > 0) & (kk < n_elements - 1)).ravel()
+            diagonal_value = 6
+            offsets = (-1, 1, -n_elements, n_elements,
+                       -n_elements * n_elements, n_elements * n_elements)
+
+            # Source function f(x, y, z) and boundary values u_0 on the whole grid
+            X, Y, Z = np.meshgrid(coords, coords, coords, indexing='ij')
+            u_0 = np.sin(X * Y * Z).ravel()
+            source = (X**2 * Y**2 + Z**2 * Y**2 + X**2 * Z**2).ravel() * u_0
         else:
             print("Invalid dimension")
             return None, None
 
-    def get_neighbors_2d(self, p, n_elements):
-        i = p // n_elements
-        j = p % n_elements
-        neighbors = []
-        if j > 0:
-            neighbors.append(p - 1)  # Left neighbor
-        if j < n_elements - 1:
-            neighbors.append(p + 1)  # Right neighbor
-        if i > 0:
-            neighbors.append(p - n_elements)  # Bottom neighbor
-        if i < n_elements - 1:
-            neighbors.append(p + n_elements)  # Top neighbor
-        return neighbors
-
-    def get_neighbors_3d(self, p, n_elements):
-        n2 = n_elements * n_elements
-        i = p // n2
-        j = (p % n2) // n_elements
-        k = p % n_elements
-        neighbors = []
-        if k > 0:
-            neighbors.append(p - 1)  # Back neighbor
-        if k < n_elements - 1:
-            neighbors.append(p + 1)  # Front neighbor
-        if j > 0:
-            neighbors.append(p - n_elements)  # Left neighbor
-        if j < n_elements - 1:
-            neighbors.append(p + n_elements)  # Right neighbor
-        if i > 0:
-            neighbors.append(p - n2)  # Bottom neighbor
-        if i < n_elements - 1:
-            neighbors.append(p + n2)  # Top neighbor
-        return neighbors
+        # Boundary condition u = u_0 on the boundary, scaled source on interior nodes
+        f_vector = np.where(interior, source * spacing**2, u_0)
+
+        # Adjust RHS for interior nodes to account for boundary conditions. Stepping
+        # off an edge of the grid wraps onto the opposite face, which is boundary too,
+        # so masking out-of-range and boundary neighbors is enough.
+        is_boundary = ~interior
+        boundary_nodes = np.flatnonzero(is_boundary)
+        boundary_values = f_vector[boundary_nodes]
+        for offset in offsets:
+            neighbors = boundary_nodes + offset
+            coupled = (neighbors >= 0) & (neighbors < num_points)
+            coupled[coupled] = interior[neighbors[coupled]]
+            np.add.at(f_vector, neighbors[coupled], boundary_values[coupled])
+
+        # Every node has a diagonal entry, and every interior node is coupled to
+        # its interior neighbors, so the number of triplets is known in advance
+        interior_width = max(n_elements - 2, 0)
+        num_triplets = num_points + 2 * dimension * max(interior_width - 1, 0) * interior_width**(dimension - 1)
+        I = np.empty(num_triplets, dtype=np.int32)
+        J = np.empty(num_triplets, dtype=np.int32)
+        # All stencil entries are small integers, so the values are stored as int8;
+        # float_matrix() converts them for the factorizations and direct solvers
+        V = np.empty(num_triplets, dtype=np.int8)
+
+        # Diagonal entries: the stencil weight on interior nodes, 1 on boundary nodes
+        I[:num_points] = nodes
+        J[:num_points] = nodes
+        V[:num_points] = np.where(interior, diagonal_value, 1)
+        position = num_points
+
+        # Off-diagonal entries: -1 between neighboring interior nodes. Couplings to
+        # boundary nodes were moved to the RHS above instead of being stored, which
+        # keeps the matrix symmetric without zeroing rows and columns afterwards.
+        interior_nodes = nodes[interior]
+        for offset in offsets:
+            neighbors = interior_nodes + offset
+            coupled = interior[neighbors]
+
+            end = position + np.count_nonzero(coupled)
+            I[position:end] = interior_nodes[coupled]
+            J[position:end] = neighbors[coupled]
+            V[position:end] = -1
+            position = end
+
+        A = coo_matrix((V, (I, J)), shape=(num_points, num_points))
+
+        # CSC is the format spsolve and CHOLMOD work on, so convert only once here
+        return A.tocsc(), f_vector
 
     def exact_solution(self, n_elements):
         spacing = 1.0 / (n_elements + 1)
+        coords = np.arange(1, n_elements + 1) * spacing
         if self.dimension == 2:
-            u_exact = np.zeros(n_elements * n_elements)
-            for i in range(n_elements):
-                for j in range(n_elements):
-                    x = (i + 1) * spacing
-                    y = (j + 1) * spacing
-                    p = i * n_elements + j
-                    u_exact[p] = math.sin(x * y)
-            return u_exact
+            X, Y = np.meshgrid(coords, coords, indexing='ij')
+            return np.sin(X * Y).ravel()
         elif self.dimension == 3:
-            u_exact = np.zeros(n_elements * n_elements * n_elements)
-            for i in range(n_elements):
-                for j in range(n_elements):
-                    for k in range(n_elements):
-                        x = (i + 1) * spacing
-                        y = (j + 1) * spacing
-                        z = (k + 1) * spacing
-                        p = i * n_elements * n_elements + j * n_elements + k
-                        u_exact[p] = math.sin(x * y * z)
-            return u_exact
+            X, Y, Z = np.meshgrid(coords, coords, coords, indexing='ij')
+            return np.sin(X * Y * Z).ravel()
         else:
             print("Invalid dimension")
             return None
 
-    def cholesky(self, matrix):
+    def cholesky(self, matrix, symbolic=None):
         time_start = time.perf_counter()
-        matrix_dense = matrix.toarray()
-        cholesky_factor = np.linalg.cholesky(matrix_dense)
+        if symbolic is not None:
+            # Numeric factorization only, reusing the analysis of the sparsity pattern
+            cholesky_factor = symbolic.cholesky(matrix.tocsc().astype(np.float64, copy=False))
+        elif cholmod_cholesky is not None and scipy.sparse.issparse(matrix):
+            # Natural ordering, so CHOLMOD keeps the ordering of the given matrix
+            # and the effect of the RCM reordering stays visible
+            cholesky_factor = cholmod_cholesky(matrix.tocsc().astype(np.float64, copy=False), ordering_method="natural")
+        else:
+            # LAPACK factors a Fortran-ordered float64 array in place and zeroes the
+            # upper triangle, so the factor is the only dense N x N array allocated
+            if scipy.sparse.issparse(matrix):
+                matrix_dense = matrix.astype(np.float64, copy=False).toarray(order='F')
+            else:
+                matrix_dense = np.array(matrix, dtype=np.float64, order='F')
+            cholesky_factor = dense_cholesky(matrix_dense, lower=True, overwrite_a=True, check_finite=False)
         time_taken = time.perf_counter() - time_start
         return cholesky_factor, time_taken
 
@@ -205,48 +252,110 @@ class Problem():
             x[i] = (y[i] - np.dot(L_T[i, i + 1:], x[i + 1:])) / L_T[i, i]
         return x
 
-    def solve_cholesky(self, cholesky_factor):
-        """Solve Ax = b using the Cholesky decomposition."""
-        time_start = time.perf_counter()
-        y = self.forward_substitution(cholesky_factor, self.rhs)
-        time_forward_solve = time.perf_counter() - time_start
+    def float_matrix(self, reorder=False):
+        """Return a float64 copy of the (reordered) int8 matrix, converted on first use."""
+        if reorder:
+            if self.reordered_matrix_float is None:
+                self.reordered_matrix_float = self.reordered_matrix.astype(np.float64)
+            return self.reordered_matrix_float
+
+        if self.matrix_float is None:
+            self.matrix_float = self.matrix.astype(np.float64)
+        return self.matrix_float
+
+    def factorize(self, reorder=False):
+        """Return the Cholesky factor and factorization time of the (reordered) matrix."""
+        # The factor itself is not kept, since a dense 3D factor would pin gigabytes
+        # in the get_problem cache; only its nonzero count is recorded for fill_in_ratio().
+        # The symbolic analysis only depends on the sparsity pattern, so it is done
+        # once per ordering and reused by every numeric factorization. Its time is
+        # still added to the reported time, so that CHOLMOD timings stay comparable
+        # with the dense path, which always times the whole factorization
+        matrix = self.float_matrix(reorder)
+        if reorder:
+            if cholmod_analyze is not None and self.symbolic_reordered is None:
+                time_start = time.perf_counter()
+                self.symbolic_reordered = cholmod_analyze(matrix, ordering_method="natural")
+                self.analyze_time_reordered = time.perf_counter() - time_start
+            cholesky_factor, cholesky_time = self.cholesky(matrix, self.symbolic_reordered)
+            if self.cholesky_nnz_reordered is None:
+                self.cholesky_nnz_reordered = self.factor_nnz(cholesky_factor)
+            return cholesky_factor, self.analyze_time_reordered + cholesky_time
+
+        if cholmod_analyze is not None and self.symbolic is None:
+            time_start = time.perf_counter()
+            self.symbolic = cholmod_analyze(matrix, ordering_method="natural")
+            self.analyze_time = time.perf_counter() - time_start
+        cholesky_factor, cholesky_time = self.cholesky(matrix, self.symbolic)
+        if self.cholesky_nnz is None:
+            self.cholesky_nnz = self.factor_nnz(cholesky_factor)
+        return cholesky_factor, self.analyze_time + cholesky_time
+
+    def sparse_lu(self):
+        """Return the (cached) SuperLU factorization of the matrix."""
+        if self.lu is None:
+            self.lu = splu(self.float_matrix(), permc_spec='MMD_AT_PLUS_A')
+        return self.lu
+
+    def solve_cholesky(self, cholesky_factor, reorder=False):
+        """Solve Ax = b using the Cholesky decomposition, of the reordered matrix if reorder is set."""
+        rhs = self.reordered_rhs if reorder else self.rhs
+        if Factor is not None and isinstance(cholesky_factor, Factor):
+            time_start = time.perf_counter()
+            y = cholesky_factor.solve_L(cholesky_factor.apply_P(rhs), use_LDLt_decomposition=False)
+            time_forward_solve = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            x = cholesky_factor.apply_Pt(cholesky_factor.solve_Lt(y, use_LDLt_decomposition=False))
+            time_backward_solve = time.perf_counter() - time_start
+        else:
+            time_start = time.perf_counter()
+            y = solve_triangular(cholesky_factor, rhs, lower=True, check_finite=False)
+            time_forward_solve = time.perf_counter() - time_start
 
-        time_start = time.perf_counter()
-        x = self.backward_substitution(cholesky_factor.T, y)
-        time_backward_solve = time.perf_counter() - time_start
+            time_start = time.perf_counter()
+            x = solve_triangular(cholesky_factor, y, lower=True, trans='T', check_finite=False)
+            time_backward_solve = time.perf_counter() - time_start
+
+        if reorder:
+            # Return the solution in the original node ordering
+            x = np.take(x, self.inverse_order)
 
         return x, time_forward_solve, time_backward_solve
 
+    def factor_nnz(self, cholesky_factor):
+        """Count the nonzeros of a Cholesky factor, ignoring numerical zeros in the dense case."""
+        if Factor is not None and isinstance(cholesky_factor, Factor):
+            return cholesky_factor.L().nnz
+        # The dense factor already has zeros above the diagonal
+        # Two boolean masks instead of np.abs, which would copy the whole dense factor
+        return int(np.count_nonzero(cholesky_factor > 1e-12) + np.count_nonzero(cholesky_factor < -1e-12))
+
     def fill_in_ratio(self, reorder=False):
         if reorder:
-            cholesky_factor, _ = self.cholesky(self.reordered_matrix)
-            nnz_A = self.reordered_matrix.nnz
-            nnz_C = np.count_nonzero(cholesky_factor)
-        else:
-            cholesky_factor, _ = self.cholesky(self.matrix)
-            nnz_A = self.matrix.nnz
-            nnz_C = np.count_nonzero(cholesky_factor)
+            if self.cholesky_nnz_reordered is None:
+                self.factorize(reorder=True)
+            return self.cholesky_nnz_reordered / self.reordered_matrix.nnz
 
-        return nnz_C / nnz_A
+        if self.cholesky_nnz is None:
+            self.factorize()
+        return self.cholesky_nnz / self.matrix.nnz
 
     def reorder(self):
-        rcm_order = scipy.sparse.csgraph.reverse_cuthill_mckee(self.matrix)
-        return self.matrix[rcm_order, :][:, rcm_order]
-
-    def ssor_step(self,A,rhs, length_rhs, x, omega):
-        # Forward sweep
-        for i in range(length_rhs):
-            sigma = x[i].copy()
-            x[i] = (rhs[i] - A[i, :i] @ x[:i] - A[i, i+1:] @ x[i+1:]) / A[i, i]
-            x[i] = (1 - omega) * sigma + omega * x[i]
-
-        # Backward sweep
-        for i in reversed(range(length_rhs)):
-            sigma = x[i].copy()
-            x[i] = (rhs[i] - A[i, :i] @ x[:i] - A[i, i+1:] @ x[i+1:]) / A[i, i]
-            x[i] = (1 - omega) * sigma + omega * x[i]
-        
-        return x
+        # The matrix is symmetric by construction, so skip RCM's symmetrization of the pattern
+        self.rcm_order = scipy.sparse.csgraph.reverse_cuthill_mckee(self.matrix, symmetric_mode=True)
+        return self.matrix[self.rcm_order, :][:, self.rcm_order].tocsc()
+
+    def stencil_matvec(self, x):
+        """Compute A @ x by applying the finite difference stencil directly on the grid."""
+        if numba is None:
+            # The stencil kernels are only fast when compiled, so use the sparse product
+            return self.matrix @ x
+        n = self.n_elements
+        grid_shape = (n,) * self.dimension
+        if self.dimension == 2:
+            return stencil_matvec_2d(x.reshape(grid_shape), np.empty(grid_shape), n).ravel()
+        return stencil_matvec_3d(x.reshape(grid_shape), np.empty(grid_shape), n).ravel()
 
     def ssor(self, x0=None, omega=1.5, tol=1e-10, max_iter=1000):
         n = len(self.rhs)
@@ -255,14 +364,15 @@ class Problem():
         else:
             x = x0.copy()
 
-        A = self.matrix.todense()
+        A = self.matrix.tocsr()
+        diag = A.diagonal()
 
-        residuals = [np.linalg.norm(self.rhs - A @ x) / np.linalg.norm(self.rhs)]
+        residuals = [np.linalg.norm(self.rhs - self.stencil_matvec(x)) / np.linalg.norm(self.rhs)]
         for k in range(max_iter):
 
-            x = self.ssor_step(A, self.rhs, n, x, omega)
+            x = ssor_sweep(A.indptr, A.indices, A.data, diag, self.rhs, x, omega, n)
 
-            residual = np.linalg.norm(self.rhs - A @ x) / np.linalg.norm(self.rhs)
+            residual = np.linalg.norm(self.rhs - self.stencil_matvec(x)) / np.linalg.norm(self.rhs)
             residuals.append(residual)
             if residual < tol:
                 break
@@ -344,22 +454,27 @@ class Problem():
         
         return x, Residuals
 
+@functools.lru_cache(maxsize=64)
+def get_problem(n_elements, dimension):
+    """Return a shared Problem, so back-to-back drivers reuse its assembly, orderings and factor counts."""
+    return Problem(n_elements, dimension)
+
 def compare_methods():
     p_values = range(2, 11)
     for p in p_values:
         n_elements = 2 * p - 1
-        problem = Problem(n_elements, 3)
+        problem = get_problem(n_elements, 3)
         u_exact = problem.exact_solution(n_elements)
-        cho_fac, _ = problem.cholesky(problem.matrix)
+        cho_fac, _ = problem.factorize()
         u_h_cholesky = problem.solve_cholesky(cho_fac)[0]
         u_h_ssor,_ = problem.ssor()
         u_h_cg, _ = problem.cg_with_ssor()
-        u_h_spsolve = spsolve(problem.matrix, problem.rhs)
+        u_h_lu = problem.sparse_lu().solve(problem.rhs)
         error_cholesky = np.max(np.abs(u_h_cholesky - u_exact))
-        error_spsolve = np.max(np.abs(u_h_spsolve - u_exact))
+        error_lu = np.max(np.abs(u_h_lu - u_exact))
         error_ssor = np.max(np.abs(u_h_ssor- u_exact))
         error_cg = np.max(np.abs(u_h_cg - u_exact))
-        print(f"p = {p}, Error (Cholesky): {error_cholesky}, Error (spsolve): {error_spsolve}, Error (ssor): {error_ssor}, Error (CG): {error_cg}")
+        print(f"p = {p}, Error (Cholesky): {error_cholesky}, Error (splu): {error_lu}, Error (ssor): {error_ssor}, Error (CG): {error_cg}")
 
 def check_SPD(p=5):
     n_elements = 2 * p - 1
@@ -388,8 +503,8 @@ def E2(dimension=2):
         print(f"p = {p}")
         n_elements = 2 * p - 1  
         h = 1.0 / (n_elements + 1) 
-        problem = Problem(n_elements, dimension)
-        u_h = spsolve(problem.matrix, problem.rhs)
+        problem = get_problem(n_elements, dimension)
+        u_h = problem.sparse_lu().solve(problem.rhs)
         u_exact = problem.exact_solution(n_elements)
         error = np.max(np.abs(u_h - u_exact))
         errors.append(error)
@@ -406,6 +521,21 @@ def E2(dimension=2):
     plt.savefig(f"E2_p_{p_values[-1]}_{dimension}.png")
     plt.clf()
 
+def _plot_times(n, measured, theoretical, path, xlabel="Problem Size (N)", ylabel="Time (seconds)", grid=True):
+    """Plot measured (label, times) series against N on a log scale and save the figure."""
+    fig, ax = plt.subplots()
+    if theoretical is not None:
+        ax.semilogy(n, theoretical, '--', label="Theoretical")
+    for label, times in measured:
+        ax.semilogy(n, times, '-o', label=label)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    if grid:
+        ax.grid(True, which="both", linestyle="--", linewidth=0.5)
+    fig.savefig(path)
+    plt.close(fig)
+
 def E3(dimension=2, reorder=False):
     if dimension == 2:
         p_values = range(2, 11)
@@ -421,75 +551,31 @@ def E3(dimension=2, reorder=False):
     for p in p_values:
         n_elements = 2 * p - 1
         n.append(n_elements**dimension)
-        problem = Problem(n_elements, 3)
-        if reorder:
-            problem.matrix = problem.reordered_matrix
-        chol_fac, cholesky_time = problem.cholesky(problem.matrix)
+        problem = get_problem(n_elements, dimension)
+        chol_fac, cholesky_time = problem.factorize(reorder)
         cholesky_times.append(cholesky_time)
-        _, forward_solve_time, backward_solve_time = problem.solve_cholesky(chol_fac)
+        _, forward_solve_time, backward_solve_time = problem.solve_cholesky(chol_fac, reorder)
         forward_solve_times.append(forward_solve_time)
         backward_solve_times.append(backward_solve_time)
 
-
-    theoretical_times = [(n_i**3 + n_i)*(cholesky_times[0]/(n[0]**3 + n[0])) for n_i in n]
-
-    # Plot the results
-    plt.semilogy(n, theoretical_times, '--', label="Theoretical")
-    plt.semilogy(n, cholesky_times, '-o', label="Cholesky (Measured)")
-    plt.xlabel("Problem Size (N)")
-    plt.ylabel("Time (seconds)")
-    plt.legend()
-    plt.grid(True, which="both", linestyle="--", linewidth=0.5)
     if reorder:
-        plt.savefig(f"5/E5_p_{p_values[-1]}_{dimension}_Cholesky.png")
+        path = f"5/E5_p_{p_values[-1]}_{dimension}"
     else:
-        plt.savefig(f"3/E3_p_{p_values[-1]}_{dimension}_Cholesky.png")
-    plt.clf()
+        path = f"3/E3_p_{p_values[-1]}_{dimension}"
 
-    theoretical_times = [(n_i**2 + n_i)*(forward_solve_times[0]/(n[0]**2 + n[0])) for n_i in n]
+    theoretical_times = [(n_i**3 + n_i)*(cholesky_times[0]/(n[0]**3 + n[0])) for n_i in n]
+    _plot_times(n, [("Cholesky (Measured)", cholesky_times)], theoretical_times, f"{path}_Cholesky.png")
 
-    # Plot the results
-    plt.semilogy(n, theoretical_times, '--', label="Theoretical")
-    plt.semilogy(n, forward_solve_times, '-o', label="forward solve (Measured)")
-    plt.xlabel("Problem Size (N)")
-    plt.ylabel("Time (seconds)")
-    plt.legend()
-    plt.grid(True, which="both", linestyle="--", linewidth=0.5)
-    if reorder:
-        plt.savefig(f"5/E5_p_{p_values[-1]}_{dimension}_Forward.png")
-    else:
-        plt.savefig(f"3/E3_p_{p_values[-1]}_{dimension}_Forward.png")
-    plt.clf()
+    theoretical_times = [(n_i**2 + n_i)*(forward_solve_times[0]/(n[0]**2 + n[0])) for n_i in n]
+    _plot_times(n, [("forward solve (Measured)", forward_solve_times)], theoretical_times, f"{path}_Forward.png")
 
     theoretical_times = [(n_i**2 + n_i)*(backward_solve_times[0]/(n[0]**2 + n[0])) for n_i in n]
+    _plot_times(n, [("backward solve (Measured)", backward_solve_times)], theoretical_times, f"{path}_Backward.png")
 
-    # Plot the results
-    plt.semilogy(n, theoretical_times, '--', label="Theoretical")
-    plt.semilogy(n, backward_solve_times, '-o', label="backward solve (Measured)")
-    plt.xlabel("Problem Size (N)")
-    plt.ylabel("Time (seconds)")
-    plt.legend()
-    plt.grid(True, which="both", linestyle="--", linewidth=0.5)
-    if reorder:
-        plt.savefig(f"5/E5_p_{p_values[-1]}_{dimension}_Backward.png")
-    else:
-        plt.savefig(f"3/E3_p_{p_values[-1]}_{dimension}_Backward.png")
-    plt.clf()
-
-
-
-
-    plt.semilogy(n, cholesky_times, '-o', label="Cholesky")
-    plt.semilogy(n, forward_solve_times, '-o', label="Forward Solve")
-    plt.semilogy(n, backward_solve_times, '-o', label="Backward Solve")
-    plt.xlabel("N (Number of Elements)")
-    plt.ylabel("Time (s)")
-    plt.legend()
-    if reorder:
-        plt.savefig(f"5/E5_p_{p_values[-1]}_{dimension}.png")
-    else:
-        plt.savefig(f"3/E3_p_{p_values[-1]}_{dimension}.png")
-    plt.clf()
+    _plot_times(n, [("Cholesky", cholesky_times),
+                    ("Forward Solve", forward_solve_times),
+                    ("Backward Solve", backward_solve_times)],
+                None, f"{path}.png", xlabel="N (Number of Elements)", ylabel="Time (s)", grid=False)
 
 def E4(dimension=2, reorder=False):
     if dimension == 2:
@@ -504,7 +590,7 @@ def E4(dimension=2, reorder=False):
     for p in p_values:
         n_elements = 2 * p - 1
         
-        problem = Problem(n_elements, dimension)
+        problem = get_problem(n_elements, dimension)
         fill_in_ratio = problem.fill_in_ratio(reorder)
         problem_size.append(n_elements**dimension)
         fill_in_ratios.append(fill_in_ratio)
@@ -553,17 +639,17 @@ def E5(dimension=2, a=False, b=False):
         for p in p_values:
             n_elements = 2 * p - 1
             n.append(n_elements**dimension)
-            problem = Problem(n_elements, 3)
+            problem = get_problem(n_elements, dimension)
 
-            chol_fac, cholesky_time = problem.cholesky(problem.matrix)
+            chol_fac, cholesky_time = problem.factorize()
             _, forward_solve_time, backward_solve_time = problem.solve_cholesky(chol_fac)
             forward_solve_times.append(forward_solve_time)
             backward_solve_times.append(backward_solve_time)
             cholesky_times.append(cholesky_time)
             
             
-            chol_fac_r, cholesky_time_reo = problem.cholesky(problem.reordered_matrix)
-            _, forward_solve_time_reo, backward_solve_time_reo = problem.solve_cholesky(chol_fac_r)
+            chol_fac_r, cholesky_time_reo = problem.factorize(reorder=True)
+            _, forward_solve_time_reo, backward_solve_time_reo = problem.solve_cholesky(chol_fac_r, reorder=True)
             forward_solve_times_reorderd.append(forward_solve_time_reo)
             backward_solve_times_reorderd.append(backward_solve_time_reo)
             cholesky_times_reorderd.append(cholesky_time_reo)
@@ -636,7 +722,7 @@ def E5(dimension=2, a=False, b=False):
         for p in p_values:
             n_elements = 2 * p - 1
             
-            problem = Problem(n_elements, dimension)
+            problem = get_problem(n_elements, dimension)
             fill_in_ratio = problem.fill_in_ratio()
             fill_in_ratio_reordered = problem.fill_in_ratio(True)
             problem_size.append(n_elements**dimension)
@@ -694,8 +780,9 @@ def E8(dim=2):
         prob = Problem(n_elements, dim)
         
         # Time for direct solve
+        matrix_float = prob.float_matrix()
         time_start = time.perf_counter()
-        direct_sol = spsolve(prob.matrix, prob.rhs)
+        direct_sol = spsolve(matrix_float, prob.rhs)
         time_direct_sol = time.perf_counter() - time_start
 
         # Time for SSOR solve
@@ -766,8 +853,9 @@ def E10(dim=2):
         prob = Problem(n_elements, dim)
         
         # Time for direct solve
+        matrix_float = prob.float_matrix()
         time_start = time.perf_counter()
-        direct_sol = spsolve(prob.matrix, prob.rhs)
+        direct_sol = spsolve(matrix_float, prob.rhs)
         time_direct_sol = time.perf_counter() - time_start
 
         # Time for SSOR solve
@@ -837,7 +925,7 @@ E9()
 # plt.savefig("spaity_pattern_matrix.png")
 # plt.clf()
 
-# plt.spy(p.cholesky_factor, markersize=0.5)
+# plt.spy(p.factorize()[0], markersize=0.5)
 # plt.savefig("spaity_pattern_cholesky.png")
 # plt.clf()
 
@@ -845,6 +933,6 @@ E9()
 # plt.savefig("spaity_pattern_reordered.png")
 # plt.clf()
 
-# plt.spy(p.cholesky_factor_reorderd, markersize=0.5)
+# plt.spy(p.factorize(reorder=True)[0], markersize=0.5)
 # plt.savefig("spaity_pattern_cholesky_reordered.png")
 # plt.clf()
\ No newline at end of file